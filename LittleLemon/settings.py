@@ -16,6 +16,7 @@ Django settings for LittleLemon project.
 Generated by 'django-admin startproject' using Django 4.2.4.
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'LittleLemonAPI.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -82,6 +84,49 @@ DATABASES = {
     }
 }
 
+# Read replicas used for list endpoints, as aliases in DATABASES; empty means
+# everything hits 'default'
+DATABASE_ROUTERS = ['LittleLemonAPI.routers.ReplicaRouter']
+REPLICA_DATABASES = []
+REPLICA_HEALTH_CHECK_INTERVAL = 30  # seconds
+
+# Background job queue (python manage.py run_jobs)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10  # seconds, doubled on each retry
+JOB_VISIBILITY_TIMEOUT = 300  # seconds before a running job can be reclaimed
+JOB_RETENTION = 7 * 24 * 3600  # seconds to keep finished jobs
+JOB_PURGE_INTERVAL = 3600  # seconds between sweeps of finished jobs
+
+# Order event stream (/api/orders/events). FileBackend shares events between
+# local processes through ORDER_EVENTS_FILE; LocalBackend stays in-process.
+ORDER_EVENTS_BACKEND = 'LittleLemonAPI.events.LocalBackend'
+ORDER_EVENTS_FILE = BASE_DIR / 'order_events.jsonl'
+ORDER_EVENTS_FILE_MAX_BYTES = 10 * 1024 * 1024  # rotated to ORDER_EVENTS_FILE.1 past this
+ORDER_EVENTS_KEEPALIVE = 15  # seconds between keep-alive comments
+ORDER_EVENTS_MAX_AGE = 300  # seconds before a stream closes and the client reconnects
+
+# Cart storage. CachedCartStore keeps carts in memory and writes them back to
+# the Cart table in batches (single-process deployments only).
+CART_STORE = 'LittleLemonAPI.carts.DatabaseCartStore'
+CART_CACHE_MAX_CARTS = 1000
+CART_FLUSH_INTERVAL = 30  # seconds
+
+# On-demand request profiling: staff send X-Profile: sampling|deterministic
+# (or ?profile=); PROFILING_SAMPLE_RATE profiles a random share of requests.
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_MODE = 'sampling'
+PROFILING_SAMPLE_INTERVAL = 0.005  # seconds
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_FILES = 50
+
+# Popular dishes (/api/menu-items/top); run_jobs rebuilds the rankings every
+# POPULARITY_REBUILD_INTERVAL, `manage.py rebuild_popularity` does it on demand
+POPULARITY_TOP_N = 10
+POPULARITY_REBUILD_INTERVAL = 3600  # seconds
+
+# Orders per delivery batch in /api/orders/workload
+DELIVERY_BATCH_SIZE = 5
+
 # Password validation
 # AUTH_PASSWORD_VALIDATORS = [
 #     {
@@ -142,3 +187,17 @@ DJOSER = {
     'LOGIN_FIELD': 'username',
 }
 
+# Test runs. Selected here so every way of running `test` (manage.py,
+# django-admin, python -m django) gets the same configuration.
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    # Secure hashing dominates fixture setup and buys nothing in tests
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+    TEST_RUNNER = 'LittleLemon.test_runner.TimedTestRunner'
+
+    # Second database standing in for a read replica in the router tests
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
@@ -0,0 +1,79 @@
+"""
+Test runner that defaults to one process per core and reports how long
+each test took, including tests run in parallel worker processes.
+"""
+
+import time
+import unittest
+
+from django.test.runner import DiscoverRunner, ParallelTestSuite, RemoteTestResult, RemoteTestRunner
+
+
+class TimedRemoteTestResult(RemoteTestResult):
+    def startTest(self, test):
+        self._started = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        # Replayed in the parent just before stopTest
+        self.events.append(('addTiming', self.test_index, time.perf_counter() - self._started))
+        super().stopTest(test)
+
+
+class TimedRemoteTestRunner(RemoteTestRunner):
+    resultclass = TimedRemoteTestResult
+
+
+class TimedParallelTestSuite(ParallelTestSuite):
+    runner_class = TimedRemoteTestRunner
+
+
+class TimedTextTestResult(unittest.TextTestResult):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timings = []
+
+    def startTest(self, test):
+        self._started = time.perf_counter()
+        self._remote_elapsed = None
+        super().startTest(test)
+
+    def addTiming(self, test, elapsed):
+        self._remote_elapsed = elapsed
+
+    def stopTest(self, test):
+        elapsed = self._remote_elapsed
+        if elapsed is None:
+            elapsed = time.perf_counter() - self._started
+        self.timings.append((elapsed, test.id()))
+        super().stopTest(test)
+
+
+class TimedTestRunner(DiscoverRunner):
+    parallel_test_suite = TimedParallelTestSuite
+
+    def __init__(self, timings=10, **kwargs):
+        super().__init__(**kwargs)
+        self.timings = timings
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.set_defaults(parallel='auto')
+        parser.add_argument(
+            '--timings', type=int, default=10, metavar='N',
+            help='Report the N slowest tests (0 reports every test, -1 disables the report).',
+        )
+
+    def get_resultclass(self):
+        return super().get_resultclass() or TimedTextTestResult
+
+    def run_suite(self, suite, **kwargs):
+        result = super().run_suite(suite, **kwargs)
+        timings = sorted(getattr(result, 'timings', []), reverse=True)
+        if self.timings >= 0 and timings:
+            shown = timings if self.timings == 0 else timings[:self.timings]
+            self.log(f'\nSlowest tests ({len(shown)} of {len(timings)}, {sum(t for t, _ in timings):.2f}s total):')
+            for elapsed, test_id in shown:
+                self.log(f'{elapsed:8.3f}s  {test_id}')
+        return result
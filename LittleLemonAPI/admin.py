@@ -1,7 +1,43 @@
 from django.contrib import admin
 
 from django.contrib import admin
-from .models import Category, MenuItem, Cart, Order, OrderItem
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import Category, MenuItem, Cart, Order, OrderItem, Job
+
+
+class EstimatedCountPaginator(Paginator):
+    # Below this many rows an exact COUNT(*) is cheap enough
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        estimate = estimate_row_count(self.object_list.model, self.object_list.db)
+        if estimate is None or estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+def estimate_row_count(model, using):
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        else:
+            # SQLite keeps no live row estimate; fall back to an exact count.
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -11,17 +47,49 @@ class CategoryAdmin(admin.ModelAdmin):
 class MenuItemAdmin(admin.ModelAdmin):
     list_display = ['title', 'price', 'featured', 'category']
     list_filter = ['category', 'featured']
+    list_select_related = ['category']
     search_fields = ['title']
 
+# Carts churn on every checkout, so table statistics would lag too far
+# behind; the exact count stays cheap on a table that keeps emptying.
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'menuitem', 'quantity', 'price']
+    list_select_related = ['user', 'menuitem']
+    autocomplete_fields = ['user', 'menuitem']
+
+# Order items are fixed at checkout, so the inline shows them read-only
+# from one joined query instead of a widget per row.
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    fields = ['menuitem', 'quantity', 'unit_price', 'price']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('menuitem')
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['user', 'delivery_crew', 'status', 'total', 'date']
+class OrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'delivery_crew', 'status', 'total', 'date']
     list_filter = ['status', 'date']
+    list_select_related = ['user', 'delivery_crew']
+    date_hierarchy = 'date'
+    search_fields = ['=id', 'user__username']
+    autocomplete_fields = ['user', 'delivery_crew']
+    inlines = [OrderItemInline]
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ['order', 'menuitem', 'quantity', 'price']
\ No newline at end of file
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ['order', 'menuitem', 'quantity', 'price']
+    list_select_related = ['order', 'menuitem']
+    autocomplete_fields = ['order', 'menuitem']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_at', 'created']
+    list_filter = ['status', 'name']
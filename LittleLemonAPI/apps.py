@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LittlelemonapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LittleLemonAPI'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .routers import install_query_counter
+
+        connection_created.connect(install_query_counter, dispatch_uid='littlelemon_query_counter')
@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import Round
+from django.utils.text import slugify
+
+from .models import Category, MenuItem
+
+MAX_PRICE = Decimal('9999.99')
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+def parse_menu_file(fileobj, name=''):
+    content = fileobj.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if name.lower().endswith('.json') or content.lstrip().startswith(('[', '{')):
+        data = json.loads(content)
+        return data['items'] if isinstance(data, dict) else data
+    return list(csv.DictReader(io.StringIO(content)))
+
+
+def _price(value, where):
+    try:
+        price = Decimal(str(value).strip()).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'{where}: invalid price {value!r}')
+    if price < 0 or price > MAX_PRICE:
+        raise ValueError(f'{where}: price {price} is out of range')
+    return price
+
+
+def import_menu_items(rows):
+    """
+    Create menu items from dicts with title, price, category (slug) and
+    optionally featured and category_title. Unknown categories are created.
+    """
+    parsed = []
+    category_titles = {}
+    for row_number, row in enumerate(rows, start=1):
+        title = str(row.get('title') or '').strip()
+        if not title:
+            raise ValueError(f'Row {row_number}: title is required')
+        slug = slugify(str(row.get('category') or ''))
+        if not slug:
+            raise ValueError(f'Row {row_number}: category is required')
+        featured = row.get('featured') or False
+        if isinstance(featured, str):
+            featured = featured.strip().lower() in TRUE_VALUES
+        category_titles.setdefault(slug, str(row.get('category_title') or '').strip() or slug.replace('-', ' ').title())
+        parsed.append((title, _price(row.get('price'), f'Row {row_number}'), bool(featured), slug))
+
+    with transaction.atomic():
+        categories = {}
+        for category in Category.objects.filter(slug__in=category_titles).order_by('id'):
+            categories.setdefault(category.slug, category)
+        missing = [Category(slug=slug, title=title) for slug, title in category_titles.items() if slug not in categories]
+        Category.objects.bulk_create(missing)
+        if any(category.pk is None for category in missing):
+            # Backends that can't return ids from a bulk insert
+            categories.update({c.slug: c for c in Category.objects.filter(slug__in=[m.slug for m in missing])})
+        else:
+            categories.update({category.slug: category for category in missing})
+
+        items = MenuItem.objects.bulk_create([
+            MenuItem(title=title, price=price, featured=featured, category=categories[slug])
+            for title, price, featured, slug in parsed
+        ], batch_size=500)
+
+    return {'created': len(items), 'categories_created': len(missing)}
+
+
+def reprice_menu_items(queryset, price=None, percent=None):
+    """Set a fixed price or adjust by a percentage in a single UPDATE."""
+    if (price is None) == (percent is None):
+        raise ValueError('Provide exactly one of price or percent')
+    with transaction.atomic():
+        if price is not None:
+            return queryset.update(price=_price(price, 'Price'))
+        try:
+            factor = 1 + Decimal(str(percent)) / 100
+        except InvalidOperation:
+            raise ValueError(f'Invalid percent {percent!r}')
+        if factor < 0:
+            raise ValueError('Percent would make prices negative')
+        highest = queryset.aggregate(highest=Max('price'))['highest']
+        if highest is not None and (highest * factor).quantize(Decimal('0.01'), ROUND_HALF_UP) > MAX_PRICE:
+            raise ValueError(f'Percent would raise prices above {MAX_PRICE}')
+        return queryset.update(price=Round(F('price') * factor, 2))
+
+
+def set_menu_item_prices(prices):
+    """Apply an {id: price} mapping with one bulk_update."""
+    with transaction.atomic():
+        items = list(MenuItem.objects.filter(pk__in=prices).only('id', 'price'))
+        for item in items:
+            item.price = _price(prices[item.pk], f'Menu item {item.pk}')
+        MenuItem.objects.bulk_update(items, ['price'], batch_size=500)
+    return len(items)
@@ -0,0 +1,189 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+
+from .models import Cart, MenuItem
+
+logger = logging.getLogger(__name__)
+
+
+def _load(user):
+    return list(Cart.objects.filter(user=user).select_related('menuitem__category').order_by('id'))
+
+
+def _new_item(user, menuitem, quantity):
+    return Cart(
+        user=user,
+        menuitem=menuitem,
+        quantity=quantity,
+        unit_price=menuitem.price,
+        price=quantity * menuitem.price,
+    )
+
+
+class DatabaseCartStore:
+    """Every cart operation goes straight to the Cart table."""
+
+    def items(self, user):
+        return _load(user)
+
+    def add(self, user, menuitem, quantity):
+        item = _new_item(user, menuitem, quantity)
+        item.save()
+        return item
+
+    def clear(self, user):
+        Cart.objects.filter(user=user).delete()
+
+    def restore(self, user):
+        pass
+
+    def flush(self):
+        pass
+
+
+class CachedCartStore:
+    """
+    Keep carts in a bounded in-process LRU and write them back to the Cart
+    table in batches: on checkout or clear, when a cart is evicted, and every
+    CART_FLUSH_INTERVAL seconds. Carts are loaded from the table on first use,
+    so either tier gives the same view. Meant for single-process deployments.
+    """
+
+    def __init__(self, max_carts=None, flush_interval=None):
+        self.max_carts = max_carts or getattr(settings, 'CART_CACHE_MAX_CARTS', 1000)
+        self.flush_interval = flush_interval or getattr(settings, 'CART_FLUSH_INTERVAL', 30)
+        self._carts = OrderedDict()
+        self._dirty = set()
+        # Carts taken out by clear() until its transaction commits or is restored
+        self._clearing = {}
+        self._lock = threading.RLock()
+        self._last_flush = time.monotonic()
+
+    def _cart(self, user):
+        cart = self._carts.get(user.pk)
+        if cart is None:
+            cart = {item.menuitem_id: item for item in _load(user)}
+            self._carts[user.pk] = cart
+            self._evict()
+        else:
+            self._carts.move_to_end(user.pk)
+        return cart
+
+    def _evict(self):
+        evicted = {}
+        while len(self._carts) > self.max_carts:
+            user_id, cart = self._carts.popitem(last=False)
+            if user_id in self._dirty and user_id not in self._clearing:
+                evicted[user_id] = cart
+                self._dirty.discard(user_id)
+        if evicted:
+            try:
+                self._persist(evicted)
+            except Exception:
+                # Runs inside whichever request loaded a cart; don't fail it.
+                logger.exception('Could not persist %s evicted carts', len(evicted))
+
+    def _persist(self, carts):
+        # Cart rows cascade away with their menu item, so items deleted from
+        # the menu since they were cached are dropped instead of inserted.
+        menuitem_ids = {menuitem_id for cart in carts.values() for menuitem_id in cart}
+        existing = set(MenuItem.objects.filter(pk__in=menuitem_ids).values_list('pk', flat=True))
+        with transaction.atomic():
+            Cart.objects.filter(user_id__in=list(carts)).delete()
+            rows = []
+            for cart in carts.values():
+                for menuitem_id in list(cart):
+                    if menuitem_id not in existing:
+                        del cart[menuitem_id]
+                        continue
+                    item = cart[menuitem_id]
+                    item.pk = None
+                    item._state.adding = True
+                    rows.append(item)
+            Cart.objects.bulk_create(rows)
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except Exception:
+                # The carts stay dirty and are retried on the next interval.
+                logger.exception('Could not flush cached carts')
+
+    def items(self, user):
+        with self._lock:
+            items = list(self._cart(user).values())
+            self._maybe_flush()
+        return items
+
+    def add(self, user, menuitem, quantity):
+        with self._lock:
+            cart = self._cart(user)
+            if menuitem.pk in cart:
+                # Same outcome as the (user, menuitem) unique constraint on Cart
+                raise IntegrityError('UNIQUE constraint failed: Cart.user_id, Cart.menuitem_id')
+            item = _new_item(user, menuitem, quantity)
+            cart[menuitem.pk] = item
+            self._dirty.add(user.pk)
+            self._maybe_flush()
+        return item
+
+    def clear(self, user):
+        # Take the cart out under the lock so no flush can write it back
+        # behind the DELETE; restore() puts it back if the checkout fails.
+        with self._lock:
+            self._clearing[user.pk] = (self._carts.pop(user.pk, None), user.pk in self._dirty)
+            self._dirty.discard(user.pk)
+            Cart.objects.filter(user=user).delete()
+        transaction.on_commit(lambda: self._cleared(user.pk))
+
+    def _cleared(self, user_id):
+        with self._lock:
+            self._clearing.pop(user_id, None)
+            # Anything cached meanwhile was read before the DELETE committed.
+            self._carts.pop(user_id, None)
+            self._dirty.discard(user_id)
+
+    def restore(self, user):
+        """Undo clear() after its transaction rolled back."""
+        with self._lock:
+            if user.pk not in self._clearing:
+                return
+            cart, dirty = self._clearing.pop(user.pk)
+            if cart is not None:
+                self._carts[user.pk] = cart
+                if dirty:
+                    self._dirty.add(user.pk)
+            self._evict()
+
+    def flush(self):
+        with self._lock:
+            dirty = {
+                user_id: self._carts[user_id]
+                for user_id in self._dirty
+                if user_id in self._carts and user_id not in self._clearing
+            }
+            try:
+                if dirty:
+                    self._persist(dirty)
+                self._dirty -= dirty.keys()
+            finally:
+                self._last_flush = time.monotonic()
+
+
+_store = None
+
+
+def get_cart_store():
+    global _store
+    if _store is None:
+        _store = import_string(getattr(settings, 'CART_STORE', 'LittleLemonAPI.carts.DatabaseCartStore'))()
+        atexit.register(_store.flush)
+    return _store
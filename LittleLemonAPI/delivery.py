@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from . import events
+from .models import Order
+
+CENTS = Decimal('0.01')
+
+
+def _money(amount):
+    # Same rendering as the serializers' DecimalFields, never a JSON float
+    return str(Decimal(amount).quantize(CENTS))
+
+
+def crew_workload(user):
+    """
+    All of a crew member's undelivered orders in one query, grouped into
+    batches of up to DELIVERY_BATCH_SIZE orders. Orders for the same customer
+    share a batch unless there are more of them than fit in one, in which
+    case they fill consecutive batches; older orders go out first.
+    """
+    rows = (
+        Order.objects.filter(delivery_crew=user, status=False)
+        .annotate(items=Sum('order_items__quantity'))
+        .order_by('date', 'id')
+        .values_list('id', 'user__username', 'date', 'items', 'total')
+    )
+
+    by_customer = {}
+    for order_id, customer, date, items, total in rows:
+        by_customer.setdefault(customer, []).append(
+            {'id': order_id, 'customer': customer, 'date': date, 'items': items or 0, 'total': total}
+        )
+
+    batch_size = getattr(settings, 'DELIVERY_BATCH_SIZE', 5)
+    batches = []
+    for orders in by_customer.values():
+        for start in range(0, len(orders), batch_size):
+            chunk = orders[start:start + batch_size]
+            if not batches or len(batches[-1]) + len(chunk) > batch_size:
+                batches.append([])
+            batches[-1].extend(chunk)
+
+    all_orders = [order for batch in batches for order in batch]
+    return {
+        'orders': len(all_orders),
+        'items': sum(order['items'] for order in all_orders),
+        'total': _money(sum(order['total'] for order in all_orders)),
+        'batches': [
+            {
+                'batch': number,
+                'items': sum(order['items'] for order in batch),
+                'total': _money(sum(order['total'] for order in batch)),
+                'orders': [dict(order, total=_money(order['total'])) for order in batch],
+            }
+            for number, batch in enumerate(batches, start=1)
+        ],
+    }
+
+
+def mark_delivered(user, order_ids):
+    """Mark the crew member's undelivered orders as delivered with one UPDATE."""
+    pending = Order.objects.filter(pk__in=order_ids, delivery_crew=user, status=False)
+    with transaction.atomic():
+        # Row locks keep a manager from reassigning these orders before the
+        # UPDATE; the UPDATE repeats the crew filter for backends without them.
+        orders = list(pending.select_for_update().only('id', 'user_id', 'total'))
+        ids = [order.pk for order in orders]
+        updated = pending.filter(pk__in=ids).update(status=True)
+        if updated != len(orders):
+            # Announce only the orders this UPDATE delivered.
+            delivered = set(
+                Order.objects.filter(pk__in=ids, delivery_crew=user, status=True).values_list('id', flat=True)
+            )
+            orders = [order for order in orders if order.pk in delivered]
+        for order in orders:
+            order.delivery_crew_id = user.pk
+            order.status = True
+            events.publish(events.order_event('status_changed', order))
+    return [order.pk for order in orders]
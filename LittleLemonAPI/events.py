@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, accepts, loop, maxsize):
+        self.accepts = accepts
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event):
+        # Slow consumers lose their oldest events rather than growing without bound.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class Broker:
+    """In-process fan-out of order events to streaming subscribers."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, accepts, maxsize=100):
+        subscription = Subscription(accepts, asyncio.get_running_loop(), maxsize)
+        with self._lock:
+            self._subscribers.add(subscription)
+        get_backend().start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def dispatch(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.accepts(event):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.offer, event)
+                except RuntimeError:
+                    # The subscriber's event loop has shut down.
+                    self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """Deliver events to subscribers in this process only."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def publish(self, event):
+        self.broker.dispatch(event)
+
+
+class FileBackend:
+    """
+    Local cross-process stand-in: every process appends events to a shared
+    JSON-lines file and tails it to feed its own subscribers. Once the file
+    reaches ORDER_EVENTS_FILE_MAX_BYTES it is moved to <file>.1, replacing
+    the previous one, and a fresh file is started.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.path = str(getattr(settings, 'ORDER_EVENTS_FILE', settings.BASE_DIR / 'order_events.jsonl'))
+        self.poll_interval = getattr(settings, 'ORDER_EVENTS_POLL_INTERVAL', 0.2)
+        self.max_bytes = getattr(settings, 'ORDER_EVENTS_FILE_MAX_BYTES', 10 * 1024 * 1024)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._tail, daemon=True)
+                self._thread.start()
+
+    def publish(self, event):
+        self._rotate()
+        # A single O_APPEND write keeps lines from different processes intact.
+        line = (json.dumps(event) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def _rotate(self):
+        try:
+            if os.stat(self.path).st_size < self.max_bytes:
+                return
+            os.replace(self.path, f'{self.path}.1')
+        except FileNotFoundError:
+            # Not created yet, or another process rotated it first.
+            pass
+
+    def _rotated(self, fileobj):
+        try:
+            return os.stat(self.path).st_ino != os.fstat(fileobj.fileno()).st_ino
+        except FileNotFoundError:
+            # Moved away; wait for the next publish to create the new file.
+            return False
+
+    def _open(self):
+        open(self.path, 'a').close()
+        return open(self.path)
+
+    def _tail(self):
+        fileobj = self._open()
+        try:
+            fileobj.seek(0, os.SEEK_END)
+            partial = ''
+            while True:
+                chunk = fileobj.readline()
+                if not chunk:
+                    if self._rotated(fileobj):
+                        # The old file is drained; follow the new one from the start.
+                        fileobj.close()
+                        fileobj = self._open()
+                        partial = ''
+                        continue
+                    time.sleep(self.poll_interval)
+                    continue
+                partial += chunk
+                if partial.endswith('\n'):
+                    line, partial = partial, ''
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        event = None
+                    if not isinstance(event, dict):
+                        # A torn or foreign line must not stop the feed.
+                        logger.warning('Skipping malformed order event line: %r', line[:200])
+                        continue
+                    self.broker.dispatch(event)
+        finally:
+            fileobj.close()
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_class = import_string(getattr(settings, 'ORDER_EVENTS_BACKEND', 'LittleLemonAPI.events.LocalBackend'))
+        _backend = backend_class(broker)
+    return _backend
+
+
+def order_event(event_type, order, **extra):
+    event = {
+        'type': event_type,
+        'order': order.pk,
+        'user': order.user_id,
+        'delivery_crew': order.delivery_crew_id,
+        'status': order.status,
+        'total': str(order.total),
+    }
+    event.update(extra)
+    return event
+
+
+def publish(event):
+    # Only announce changes that actually committed.
+    transaction.on_commit(lambda: get_backend().publish(event))
+
+
+def publish_order_changes(order, previous_crew, previous_status):
+    if order.delivery_crew_id != previous_crew:
+        publish(order_event('crew_assigned', order, previous_delivery_crew=previous_crew))
+    if order.status != previous_status:
+        publish(order_event('status_changed', order))
+
+
+def accepts_for(user, role):
+    """Filter matching the orders the user can already see through /api/orders/."""
+    if role == 'manager':
+        return lambda event: True
+    if role == 'delivery_crew':
+        return lambda event: user.pk in (event['delivery_crew'], event.get('previous_delivery_crew'))
+    return lambda event: event['user'] == user.pk
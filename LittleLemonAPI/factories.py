@@ -0,0 +1,58 @@
+"""Bulk helpers for seeding test data with a handful of queries."""
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+
+from .models import Cart, Category, MenuItem, Order, OrderItem
+
+
+def create_groups():
+    manager_group, _ = Group.objects.get_or_create(name='Manager')
+    delivery_group, _ = Group.objects.get_or_create(name='Delivery Crew')
+    return manager_group, delivery_group
+
+
+def create_users(*usernames, group=None, password='password123', **fields):
+    # Hash once and share it; every user gets the same password anyway.
+    hashed = make_password(password)
+    users = User.objects.bulk_create([
+        User(username=username, email=f'{username}@test.com', password=hashed, **fields)
+        for username in usernames
+    ])
+    if group is not None:
+        group.user_set.add(*users)
+    return users
+
+
+def create_menu(categories=1, items_per_category=5, price='5.00', prefix='item'):
+    new_categories = Category.objects.bulk_create([
+        Category(slug=f'{prefix}-category-{i}', title=f'{prefix.title()} Category {i}')
+        for i in range(categories)
+    ])
+    return MenuItem.objects.bulk_create([
+        MenuItem(title=f'{prefix.title()} {c}-{i}', price=Decimal(price), category=category)
+        for c, category in enumerate(new_categories)
+        for i in range(items_per_category)
+    ])
+
+
+def fill_cart(user, menuitems, quantity=1):
+    return Cart.objects.bulk_create([
+        Cart(user=user, menuitem=item, quantity=quantity, unit_price=item.price, price=quantity * Decimal(item.price))
+        for item in menuitems
+    ])
+
+
+def create_orders(user, menuitems, count=1, quantity=1, **fields):
+    total = sum(quantity * Decimal(item.price) for item in menuitems)
+    orders = Order.objects.bulk_create([Order(user=user, total=total, **fields) for _ in range(count)])
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, menuitem=item, quantity=quantity,
+            unit_price=item.price, price=quantity * Decimal(item.price),
+        )
+        for order in orders
+        for item in menuitems
+    ])
+    return orders
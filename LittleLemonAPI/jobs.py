@@ -0,0 +1,145 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import popularity
+from .models import Job, Order
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name):
+    def register(func):
+        registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    """
+    Queue a job to run after delay seconds. Delivery is at-least-once: a job
+    whose worker dies or can't record the result is reclaimed after
+    JOB_VISIBILITY_TIMEOUT and run again, so handlers must be idempotent.
+    """
+    # The row is written through the caller's connection, so it commits or
+    # rolls back together with the surrounding transaction.
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def schedule(name, delay=0, **payload):
+    """Enqueue a recurring job unless a run of it is already waiting."""
+    with transaction.atomic():
+        if Job.objects.filter(name=name, status=Job.QUEUED).exists():
+            return None
+        return enqueue(name, delay=delay, **payload)
+
+
+def _ready(now):
+    # Running jobs whose visibility timeout has passed are up for grabs again.
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+
+
+def claim_next():
+    timeout = getattr(settings, 'JOB_VISIBILITY_TIMEOUT', 300)
+    now = timezone.now()
+    candidates = Job.objects.filter(_ready(now)).order_by('run_at').values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        claimed = Job.objects.filter(_ready(now), pk=pk).update(
+            status=Job.RUNNING,
+            locked_until=now + timedelta(seconds=timeout),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    handler = registry.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job {job.name!r}')
+        handler(**job.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.name, job.attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, locked_until=None, last_error=traceback.format_exc()
+            )
+        else:
+            backoff = getattr(settings, 'JOB_RETRY_BACKOFF', 10) * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED,
+                locked_until=None,
+                run_at=timezone.now() + timedelta(seconds=backoff),
+                last_error=traceback.format_exc(),
+            )
+        return False
+
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_until=None)
+    return True
+
+
+def purge_finished(older_than=None):
+    """Delete DONE jobs that were due more than JOB_RETENTION seconds ago."""
+    if older_than is None:
+        older_than = getattr(settings, 'JOB_RETENTION', 7 * 24 * 3600)
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(status=Job.DONE, run_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_pending(limit=None):
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+# Post-checkout work
+
+@job('notify_order_placed')
+def notify_order_placed(order_id):
+    order = Order.objects.select_related('user').get(pk=order_id)
+    logger.info('Order #%s placed by %s for %s, awaiting delivery crew', order.pk, order.user.username, order.total)
+
+
+@job('record_order_popularity')
+def record_order_popularity(order_id):
+    popularity.record_order(Order.objects.get(pk=order_id))
+
+
+# Recurring work, kept going by run_jobs
+
+@job('rebuild_popularity')
+def rebuild_popularity():
+    # Keeps the 'today' window current across midnight and fixes any drift;
+    # each run queues the next one.
+    popularity.rebuild()
+    schedule('rebuild_popularity', delay=getattr(settings, 'POPULARITY_REBUILD_INTERVAL', 3600))
+
+
+RECURRING = ['rebuild_popularity']
+
+
+def schedule_recurring():
+    for name in RECURRING:
+        schedule(name)
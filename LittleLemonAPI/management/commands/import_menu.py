@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI.bulk import import_menu_items, parse_menu_file
+
+
+class Command(BaseCommand):
+    help = 'Import menu items from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with title,price,category[,featured,category_title] columns, or a JSON list')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, 'rb') as fileobj:
+                rows = parse_menu_file(fileobj, path)
+            result = import_menu_items(rows)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} menu items ({result['categories_created']} new categories)"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI import popularity
+
+
+class Command(BaseCommand):
+    help = 'Recompute menu item popularity rollups and rankings from order history'
+
+    def handle(self, *args, **options):
+        popularity.rebuild()
+        self.stdout.write(self.style.SUCCESS('Popularity rankings rebuilt'))
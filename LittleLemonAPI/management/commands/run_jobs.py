@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections
+
+from LittleLemonAPI import jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        self.next_housekeeping = time.monotonic()
+        workers = [
+            threading.Thread(target=self.work, args=(options['poll_interval'], options['once']), daemon=True)
+            for _ in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    self.housekeeping()
+                    worker.join(0.5)
+        except KeyboardInterrupt:
+            self.stopping.set()
+            for worker in workers:
+                worker.join()
+
+    def housekeeping(self):
+        # Finished jobs are only kept for JOB_RETENTION; sweep them now and
+        # then, and restart any recurring job whose chain has stopped.
+        if time.monotonic() < self.next_housekeeping:
+            return
+        self.next_housekeeping = time.monotonic() + getattr(settings, 'JOB_PURGE_INTERVAL', 3600)
+        try:
+            jobs.schedule_recurring()
+            deleted = jobs.purge_finished()
+        except OperationalError:
+            logger.exception('Job queue housekeeping failed')
+            return
+        if deleted:
+            logger.info('Purged %s finished jobs', deleted)
+
+    def work(self, poll_interval, once):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    job = jobs.claim_next()
+                except OperationalError:
+                    # SQLite is busy with another writer; try again shortly.
+                    time.sleep(poll_interval)
+                    continue
+                if job is None:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+                try:
+                    jobs.run_job(job)
+                except OperationalError:
+                    # Recording the outcome hit a busy database. The job stays
+                    # RUNNING and is reclaimed once its visibility timeout passes.
+                    logger.exception('Could not record the result of job %s (%s)', job.pk, job.name)
+                    time.sleep(poll_interval)
+        finally:
+            connections.close_all()
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0003_popularity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_crew', 'status'], name='LittleLemon_deliver_e1645b_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:59
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def backfill_snapshots(apps, schema_editor):
+    # Existing orders get a snapshot of their items as the menu looks now,
+    # the closest record available of what was ordered. Orders are handled
+    # in pk-ordered chunks so memory stays flat on large tables.
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    OrderItem = apps.get_model('LittleLemonAPI', 'OrderItem')
+
+    last_pk = 0
+    while True:
+        orders = list(
+            Order.objects.filter(items_snapshot__isnull=True, pk__gt=last_pk).order_by('pk').only('id')[:BATCH_SIZE]
+        )
+        if not orders:
+            break
+        last_pk = orders[-1].pk
+
+        snapshots = {}
+        order_items = (
+            OrderItem.objects.filter(order_id__gte=orders[0].pk, order_id__lte=last_pk)
+            .select_related('menuitem__category')
+            .order_by('order_id', 'id')
+        )
+        for item in order_items:
+            menuitem = item.menuitem
+            snapshots.setdefault(item.order_id, []).append({
+                'menuitem': {
+                    'id': menuitem.id,
+                    'title': menuitem.title,
+                    'price': str(menuitem.price),
+                    'featured': menuitem.featured,
+                    'category': {
+                        'id': menuitem.category.id,
+                        'slug': menuitem.category.slug,
+                        'title': menuitem.category.title,
+                    },
+                },
+                'quantity': item.quantity,
+                'unit_price': str(item.unit_price),
+                'price': str(item.price),
+            })
+
+        for order in orders:
+            order.items_snapshot = snapshots.get(order.id, [])
+        Order.objects.bulk_update(orders, ['items_snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0004_order_crew_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
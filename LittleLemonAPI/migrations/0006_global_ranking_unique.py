@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:17
+
+from django.db import migrations, models
+
+
+def drop_duplicate_global_rankings(apps, schema_editor):
+    # Concurrent refreshes could insert more than one all-categories row per
+    # window; keep the newest so the constraint can be added.
+    PopularityRanking = apps.get_model('LittleLemonAPI', 'PopularityRanking')
+    keep = {}
+    for pk, window in PopularityRanking.objects.filter(category__isnull=True).order_by('updated', 'pk').values_list('pk', 'window'):
+        keep[window] = pk
+    PopularityRanking.objects.filter(category__isnull=True).exclude(pk__in=keep.values()).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0005_order_items_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_global_rankings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='popularityranking',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('window',), name='unique_global_ranking_per_window'),
+        ),
+    ]
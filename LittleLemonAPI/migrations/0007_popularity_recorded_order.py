@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0006_global_ranking_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityRecordedOrder',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='LittleLemonAPI.order')),
+            ],
+        ),
+    ]
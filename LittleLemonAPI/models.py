@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 from django.contrib.auth.models import User
@@ -35,6 +36,11 @@ class Order(models.Model):
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True, auto_now_add=True)
+    # Order items as serialized at checkout; they never change afterwards
+    items_snapshot = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['delivery_crew', 'status'])]
     
 
 class OrderItem(models.Model):
@@ -45,4 +51,61 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+
+class MenuItemDailyStats(models.Model):
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    date = models.DateField(db_index=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('menuitem', 'date')
+
+class PopularityRecordedOrder(models.Model):
+    # Orders already counted in MenuItemDailyStats, so a re-run job skips them
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True)
+
+class PopularityRanking(models.Model):
+    window = models.CharField(max_length=10)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    items = models.JSONField(default=list)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('window', 'category')
+        constraints = [
+            # NULLs never collide in unique_together, so the all-categories
+            # rows need their own constraint.
+            models.UniqueConstraint(
+                fields=['window'], condition=models.Q(category__isnull=True), name='unique_global_ranking_per_window'
+            ),
+        ]
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
@@ -0,0 +1,107 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import (
+    Category, MenuItem, MenuItemDailyStats, Order, OrderItem, PopularityRanking, PopularityRecordedOrder,
+)
+
+# Rolling windows in days, ending today
+WINDOWS = {'today': 1, '7d': 7, '30d': 30}
+
+CENTS = Decimal('0.01')
+
+
+def _since(days):
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+def record_order(order):
+    """
+    Add one order's items to the daily rollups and refresh affected rankings.
+    Each order is counted once, however often its job is delivered.
+    """
+    items = list(order.order_items.select_related('menuitem'))
+    with transaction.atomic():
+        _, created = PopularityRecordedOrder.objects.get_or_create(order_id=order.pk)
+        if not created:
+            return
+        for item in items:
+            updated = MenuItemDailyStats.objects.filter(menuitem_id=item.menuitem_id, date=order.date).update(
+                order_count=F('order_count') + 1, revenue=F('revenue') + item.price
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        MenuItemDailyStats.objects.create(
+                            menuitem_id=item.menuitem_id, date=order.date, order_count=1, revenue=item.price
+                        )
+                except IntegrityError:
+                    # Another worker created today's row first
+                    MenuItemDailyStats.objects.filter(menuitem_id=item.menuitem_id, date=order.date).update(
+                        order_count=F('order_count') + 1, revenue=F('revenue') + item.price
+                    )
+        refresh_rankings({item.menuitem.category_id for item in items})
+
+
+def top_items(window, category_id=None):
+    stats = MenuItemDailyStats.objects.filter(date__gte=_since(WINDOWS[window]))
+    if category_id is not None:
+        stats = stats.filter(menuitem__category_id=category_id)
+    rows = list(
+        stats.values('menuitem')
+        .annotate(orders=Sum('order_count'), total=Sum('revenue'))
+        .order_by('-orders', '-total', 'menuitem')[:getattr(settings, 'POPULARITY_TOP_N', 10)]
+    )
+    menuitems = MenuItem.objects.in_bulk([row['menuitem'] for row in rows])
+    return [
+        {
+            'id': row['menuitem'],
+            'title': menuitems[row['menuitem']].title,
+            'price': str(menuitems[row['menuitem']].price),
+            'category': menuitems[row['menuitem']].category_id,
+            'order_count': row['orders'],
+            'revenue': str(Decimal(str(row['total'])).quantize(CENTS)),
+        }
+        for row in rows
+    ]
+
+
+def refresh_rankings(category_ids):
+    for window in WINDOWS:
+        for category_id in [None, *category_ids]:
+            PopularityRanking.objects.update_or_create(
+                window=window, category_id=category_id,
+                defaults={'items': top_items(window, category_id)},
+            )
+
+
+def rebuild():
+    """Recompute the rollups from OrderItem and every ranking, fixing any drift."""
+    since = _since(max(WINDOWS.values()))
+    with transaction.atomic():
+        MenuItemDailyStats.objects.all().delete()
+        rows = (
+            OrderItem.objects.filter(order__date__gte=since)
+            .values('menuitem_id', 'order__date')
+            .annotate(orders=Count('order', distinct=True), total=Sum('price'))
+        )
+        MenuItemDailyStats.objects.bulk_create([
+            MenuItemDailyStats(
+                menuitem_id=row['menuitem_id'], date=row['order__date'],
+                order_count=row['orders'], revenue=row['total'],
+            )
+            for row in rows
+        ], batch_size=500)
+        # Orders in the window are now counted; older markers are no longer needed
+        PopularityRecordedOrder.objects.filter(order__date__lt=since).delete()
+        PopularityRecordedOrder.objects.bulk_create([
+            PopularityRecordedOrder(order_id=order_id)
+            for order_id in Order.objects.filter(date__gte=since).values_list('id', flat=True)
+        ], batch_size=500, ignore_conflicts=True)
+        PopularityRanking.objects.all().delete()
+        refresh_rankings(list(Category.objects.values_list('id', flat=True)))
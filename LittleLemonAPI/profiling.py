@@ -0,0 +1,195 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+
+
+def _label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class SamplingProfiler:
+    """Sample the profiled thread's stack on a timer; values are sample counts."""
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005)
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+class TracingProfiler:
+    """Record every call with sys.setprofile; values are self time in microseconds."""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._frames = []
+
+    def start(self):
+        sys.setprofile(self._trace)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def _trace(self, frame, event, arg):
+        now = time.perf_counter()
+        if event in ('call', 'c_call'):
+            label = _label(frame.f_code) if event == 'call' else getattr(arg, '__qualname__', repr(arg))
+            path = f'{self._frames[-1][0]};{label}' if self._frames else label
+            self._frames.append([path, now, 0.0])
+        elif event in ('return', 'c_return', 'c_exception') and self._frames:
+            path, started, children = self._frames.pop()
+            elapsed = now - started
+            self.stacks[path] += int((elapsed - children) * 1_000_000)
+            if self._frames:
+                self._frames[-1][2] += elapsed
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def write_profile(stacks, meta):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f'{time.time_ns() // 1000}-{uuid.uuid4().hex[:8]}'
+    with open(directory / f'{profile_id}.collapsed', 'w') as fileobj:
+        for stack, value in stacks.most_common():
+            if value > 0:
+                fileobj.write(f'{stack} {value}\n')
+    with open(directory / f'{profile_id}.json', 'w') as fileobj:
+        json.dump(dict(meta, id=profile_id), fileobj)
+
+    # Keep only the newest PROFILING_MAX_FILES profiles
+    profiles = sorted(directory.glob('*.collapsed'))
+    for old in profiles[:-getattr(settings, 'PROFILING_MAX_FILES', 50)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix('.json').unlink(missing_ok=True)
+    return profile_id
+
+
+def list_profiles():
+    profiles = []
+    for path in sorted(profile_dir().glob('*.json'), reverse=True):
+        with open(path) as fileobj:
+            meta = json.load(fileobj)
+        meta.pop('queries', None)
+        profiles.append(meta)
+    return profiles
+
+
+def profile_path(profile_id, suffix):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = profile_dir() / f'{profile_id}{suffix}'
+    return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request when a staff user sends an X-Profile header or a
+    ?profile= parameter ('sampling' or 'deterministic'), or at random with
+    PROFILING_SAMPLE_RATE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def requested_mode(self, request):
+        """Return the profiling mode, if any, and the user it was resolved for."""
+        user = request.user if request.user.is_authenticated else None
+        mode = request.headers.get('X-Profile') or request.GET.get('profile')
+        if mode:
+            if user is None and 'Authorization' in request.headers:
+                try:
+                    user = Request(request, authenticators=[TokenAuthentication(), SessionAuthentication()]).user
+                except APIException:
+                    # Bad credentials: not staff; the view reports the 401.
+                    user = None
+            if user is not None and user.is_staff:
+                return ('deterministic' if mode == 'deterministic' else 'sampling'), user
+        if random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0):
+            return getattr(settings, 'PROFILING_MODE', 'sampling'), user
+        return None, user
+
+    def __call__(self, request):
+        mode, user = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        profiler = TracingProfiler() if mode == 'deterministic' else SamplingProfiler()
+        query_log = QueryLog()
+        wrapped = [connections[alias] for alias in connections]
+        for connection in wrapped:
+            connection.execute_wrappers.append(query_log)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+            duration = time.perf_counter() - started
+            for connection in wrapped:
+                connection.execute_wrappers.remove(query_log)
+
+        profile_id = write_profile(profiler.stacks, {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': getattr(user or request.user, 'username', ''),
+            'mode': mode,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'query_count': len(query_log.queries),
+            'created': time.time(),
+            'queries': query_log.queries,
+        })
+        response['X-Profile-Id'] = profile_id
+        return response
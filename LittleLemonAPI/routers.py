@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Per-request routing state. `replica` is switched on by replica_reads() for
+# safe list traffic; `pinned` is set by the first write so later reads in the
+# same request go to the primary and users read their own writes. `used`
+# collects the replicas handed out so a failure can be pinned on them.
+_state = ContextVar('replica_routing_state', default=None)
+
+_health = {}
+_health_lock = threading.Lock()
+
+_query_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+@contextmanager
+def replica_reads():
+    state = {'replica': True, 'pinned': False, 'used': set()}
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def read_from_replica(func, *args, **kwargs):
+    """
+    Call func inside replica_reads(). If a replica fails part way through,
+    mark it unhealthy and run func once more against the primary.
+    """
+    with replica_reads() as state:
+        try:
+            return func(*args, **kwargs)
+        except DatabaseError:
+            # Don't repeat anything that already wrote to the primary.
+            if not state['used'] or state['pinned']:
+                raise
+            failed = state['used']
+    for alias in failed:
+        mark_unhealthy(alias)
+    return func(*args, **kwargs)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'REPLICA_DATABASES', []))
+
+
+def mark_unhealthy(alias):
+    with _health_lock:
+        _health[alias] = (False, time.monotonic())
+
+
+def is_healthy(alias):
+    interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 30)
+    now = time.monotonic()
+    with _health_lock:
+        cached = _health.get(alias)
+    if cached is not None and now - cached[1] < interval:
+        return cached[0]
+
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        healthy = True
+    except Exception:
+        healthy = False
+
+    with _health_lock:
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def reset_health():
+    with _health_lock:
+        _health.clear()
+
+
+def count_queries(execute, sql, params, many, context):
+    alias = context['connection'].alias
+    with _counts_lock:
+        _query_counts[alias] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # connection_created fires on every reconnect of the same wrapper.
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def query_counts():
+    with _counts_lock:
+        return dict(_query_counts)
+
+
+def reset_query_counts():
+    with _counts_lock:
+        _query_counts.clear()
+
+
+class ReplicaRouter:
+    """
+    Send reads made inside replica_reads() to a healthy replica from
+    settings.REPLICA_DATABASES; everything else stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if not state or not state['replica'] or state['pinned']:
+            return DEFAULT_DB_ALIAS
+
+        healthy = [alias for alias in replica_aliases() if is_healthy(alias)]
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        alias = random.choice(healthy)
+        state['used'].add(alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state:
+            state['pinned'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
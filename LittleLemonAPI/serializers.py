@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User, Group
+from django.db.models import prefetch_related_objects
 from .models import Category, MenuItem, Cart, Order, OrderItem
 
 class UserSerializer(serializers.ModelSerializer):
@@ -49,10 +50,28 @@ class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = ['id', 'name']
+class OrderListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        orders = list(data.all() if hasattr(data, 'all') else data)
+        # Fetch live items for all the orders without a snapshot at once
+        prefetch_related_objects(
+            [order for order in orders if order.items_snapshot is None], 'order_items__menuitem__category'
+        )
+        return super().to_representation(orders)
+
 class OrderSerializer(serializers.ModelSerializer):
-    order_items = OrderItemSerializer(many=True, read_only=True)
+    order_items = serializers.SerializerMethodField()
+    
+    def get_order_items(self, order):
+        # Orders placed before snapshots existed, or created in the admin,
+        # fall back to the live rows
+        if order.items_snapshot is not None:
+            return order.items_snapshot
+        prefetch_related_objects([order], 'order_items__menuitem__category')
+        return OrderItemSerializer(order.order_items.all(), many=True).data
     
     class Meta:
         model = Order
+        list_serializer_class = OrderListSerializer
         fields = ['id', 'user', 'delivery_crew', 'status', 'total', 'date', 'order_items']
         read_only_fields = ['user', 'total', 'date']
@@ -1,24 +1,39 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User, Group
 from rest_framework import status
-from .models import Category, MenuItem, Cart, Order
+from decimal import Decimal
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from .models import Category, MenuItem, Cart, Order, OrderItem, Job, MenuItemDailyStats, PopularityRanking
+from . import carts, events, jobs, popularity, profiling, routers
+from .admin import EstimatedCountPaginator
+from .management.commands import run_jobs
+from .factories import create_groups, create_menu, create_orders, create_users, fill_cart
 
 class LittleLemonAPITests(TestCase):
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         # Create groups
-        self.manager_group, _ = Group.objects.get_or_create(name='Manager')
-        self.delivery_group, _ = Group.objects.get_or_create(name='Delivery Crew')
+        cls.manager_group, cls.delivery_group = create_groups()
 
         # Create users
-        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password123')
-        self.manager = User.objects.create_user('manager', 'manager@test.com', 'password123')
-        self.customer = User.objects.create_user('customer', 'customer@test.com', 'password123')
-        self.delivery = User.objects.create_user('delivery', 'delivery@test.com', 'password123')
-
-        # Add manager to manager group
-        self.manager.groups.add(self.manager_group)
+        cls.admin, = create_users('admin', is_staff=True, is_superuser=True)
+        cls.manager, = create_users('manager', group=cls.manager_group)
+        cls.customer, cls.delivery = create_users('customer', 'delivery')
 
+    def setUp(self):
         # API client
         self.client = APIClient()
 
@@ -143,3 +158,751 @@ class LittleLemonAPITests(TestCase):
         self.client.force_authenticate(user=self.delivery)
         response = self.client.patch(f'/api/orders/{order_id}/', {'status': True}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer, = create_users('customer')
+
+    def setUp(self):
+        routers.reset_health()
+        routers.reset_query_counts()
+        self.router = routers.ReplicaRouter()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def test_menu_listing_reads_from_replica(self):
+        category = Category.objects.using('replica').create(slug='replica', title='Replica')
+        MenuItem.objects.using('replica').create(title='Soup', price='4.00', category=category)
+        response = self.client.get('/api/menu-items/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.data['results']], ['Soup'])
+        self.assertGreater(routers.query_counts().get('replica', 0), 0)
+
+    def test_reads_outside_listings_stay_on_primary(self):
+        self.assertEqual(self.router.db_for_read(MenuItem), 'default')
+
+    def test_reads_after_write_stay_on_primary(self):
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(MenuItem), 'replica')
+            Category.objects.create(slug='pinned', title='Pinned')
+            self.assertEqual(self.router.db_for_read(MenuItem), 'default')
+
+    @override_settings(REPLICA_DATABASES=['missing'])
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(MenuItem), 'default')
+
+    def test_marked_unhealthy_replica_is_skipped(self):
+        routers.mark_unhealthy('replica')
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(MenuItem), 'default')
+
+    def test_replica_failing_mid_request_retries_on_primary(self):
+        category = Category.objects.create(slug='primary', title='Primary')
+        MenuItem.objects.create(title='Stew', price='5.00', category=category)
+        self.assertTrue(routers.is_healthy('replica'))
+
+        def fail(execute, sql, params, many, context):
+            raise OperationalError('replica went away')
+
+        with connections['replica'].execute_wrapper(fail):
+            response = self.client.get('/api/menu-items/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.data['results']], ['Stew'])
+        self.assertFalse(routers.is_healthy('replica'))
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.registry['record'] = lambda **payload: self.calls.append(payload)
+        jobs.registry['explode'] = self.explode
+
+    def tearDown(self):
+        jobs.registry.pop('record')
+        jobs.registry.pop('explode')
+
+    def explode(self):
+        raise RuntimeError('boom')
+
+    def test_enqueue_rolls_back_with_transaction(self):
+        try:
+            with transaction.atomic():
+                jobs.enqueue('record', value=1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+
+    def test_worker_runs_job(self):
+        job = jobs.enqueue('record', value=1)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.calls, [{'value': 1}])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_failed_job_is_retried_with_backoff_then_failed(self):
+        job = jobs.enqueue('explode', max_attempts=2)
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_expired_running_job_is_reclaimed(self):
+        job = jobs.enqueue('record', value=2)
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, locked_until=timezone.now())
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.calls, [{'value': 2}])
+
+    def test_checkout_enqueues_post_checkout_job(self):
+        customer = User.objects.create_user('customer', 'customer@test.com', 'password123')
+        category = Category.objects.create(slug='snacks', title='Snacks')
+        item = MenuItem.objects.create(title='Chips', price='3.00', category=category)
+        Cart.objects.create(user=customer, menuitem=item, quantity=2, unit_price='3.00', price='6.00')
+        client = APIClient()
+        client.force_authenticate(user=customer)
+        response = client.post('/api/orders/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Cart.objects.filter(user=customer).exists())
+        self.assertTrue(Job.objects.filter(name='notify_order_placed', payload={'order_id': response.data['id']}).exists())
+        self.assertEqual(jobs.run_pending(), 2)
+
+    def test_old_finished_jobs_are_purged(self):
+        old = jobs.enqueue('record', value=1)
+        recent = jobs.enqueue('record', value=2)
+        failed = jobs.enqueue('record', value=3)
+        Job.objects.filter(pk=old.pk).update(status=Job.DONE, run_at=timezone.now() - timedelta(days=8))
+        Job.objects.filter(pk=recent.pk).update(status=Job.DONE)
+        Job.objects.filter(pk=failed.pk).update(status=Job.FAILED, run_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(jobs.purge_finished(), 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, failed.pk})
+
+    def test_worker_survives_locked_database_while_recording_result(self):
+        job = jobs.enqueue('record', value=3)
+        command = run_jobs.Command()
+        command.stopping = threading.Event()
+        with mock.patch.object(jobs, 'run_job', side_effect=[OperationalError('database is locked'), True]) as run_job, \
+                mock.patch.object(jobs, 'claim_next', side_effect=[job, job, None]):
+            command.work(poll_interval=0, once=True)
+        self.assertEqual(run_job.call_count, 2)
+
+
+class BulkMenuTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        manager_group, _ = create_groups()
+        cls.manager, = create_users('manager', group=manager_group)
+        cls.customer, = create_users('customer')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def test_manager_can_import_csv(self):
+        Category.objects.create(slug='drinks', title='Drinks')
+        upload = SimpleUploadedFile('menu.csv', b'title,price,category,featured\nLemonade,3.50,drinks,yes\nSoup,6,starters,\n')
+        response = self.client.post('/api/menu-items/import', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'created': 2, 'categories_created': 1})
+        lemonade = MenuItem.objects.get(title='Lemonade')
+        self.assertTrue(lemonade.featured)
+        self.assertEqual(lemonade.category.slug, 'drinks')
+        self.assertEqual(MenuItem.objects.get(title='Soup').category.title, 'Starters')
+
+    def test_import_rejects_bad_rows_atomically(self):
+        response = self.client.post('/api/menu-items/import', [
+            {'title': 'Tea', 'price': '2.00', 'category': 'drinks'},
+            {'title': 'Cake', 'price': 'cheap', 'category': 'dessert'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(MenuItem.objects.exists())
+
+    def test_customer_cannot_import(self):
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post('/api/menu-items/import', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_large_import_uses_constant_queries(self):
+        rows = [{'title': f'Dish {i}', 'price': '9.99', 'category': f'cat-{i % 20}'} for i in range(2000)]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/menu-items/import', rows, format='json')
+        self.assertLess(len(queries), 20)
+        self.assertEqual(MenuItem.objects.count(), 2000)
+
+    def test_reprice_by_category_percentage(self):
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        mains = Category.objects.create(slug='mains', title='Mains')
+        tea = MenuItem.objects.create(title='Tea', price='2.00', category=drinks)
+        steak = MenuItem.objects.create(title='Steak', price='20.00', category=mains)
+        response = self.client.post('/api/menu-items/reprice', {'category': 'drinks', 'percent': 10}, format='json')
+        self.assertEqual(response.data, {'updated': 1})
+        tea.refresh_from_db()
+        steak.refresh_from_db()
+        self.assertEqual(tea.price, Decimal('2.20'))
+        self.assertEqual(steak.price, Decimal('20.00'))
+
+    def test_reprice_percentage_cannot_exceed_max_price(self):
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        tea = MenuItem.objects.create(title='Tea', price='2.00', category=drinks)
+        caviar = MenuItem.objects.create(title='Caviar', price='5000.00', category=drinks)
+        response = self.client.post('/api/menu-items/reprice', {'all': True, 'percent': 200}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(MenuItem.objects.get(pk=caviar.pk).price, Decimal('5000.00'))
+        self.assertEqual(MenuItem.objects.get(pk=tea.pk).price, Decimal('2.00'))
+        self.assertEqual(self.client.get('/api/menu-items/').status_code, status.HTTP_200_OK)
+
+    def test_reprice_by_ids_and_explicit_prices(self):
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        tea = MenuItem.objects.create(title='Tea', price='2.00', category=drinks)
+        coffee = MenuItem.objects.create(title='Coffee', price='3.00', category=drinks)
+        self.client.post('/api/menu-items/reprice', {'ids': [tea.id, coffee.id], 'price': '4.00'}, format='json')
+        self.assertEqual(set(MenuItem.objects.values_list('price', flat=True)), {Decimal('4.00')})
+        self.client.post('/api/menu-items/reprice', {'prices': {str(tea.id): '1.50'}}, format='json')
+        tea.refresh_from_db()
+        self.assertEqual(tea.price, Decimal('1.50'))
+
+
+class RecordingBackend:
+    def __init__(self):
+        self.published = []
+
+    def start(self):
+        pass
+
+    def publish(self, event):
+        self.published.append(event)
+
+
+class OrderEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        manager_group, delivery_group = create_groups()
+        cls.manager, = create_users('manager', group=manager_group)
+        cls.delivery, = create_users('delivery', group=delivery_group)
+        cls.customer, = create_users('customer')
+        cls.order = Order.objects.create(user=cls.customer, total='6.00')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_assignment_and_status_changes_are_published(self):
+        backend = RecordingBackend()
+        with mock.patch.object(events, '_backend', backend), self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(user=self.manager)
+            self.client.patch(f'/api/orders/{self.order.id}', {'delivery_crew': self.delivery.id}, format='json')
+            self.client.force_authenticate(user=self.delivery)
+            self.client.patch(f'/api/orders/{self.order.id}', {'status': True}, format='json')
+        self.assertEqual([event['type'] for event in backend.published], ['crew_assigned', 'status_changed'])
+        self.assertEqual(backend.published[0]['delivery_crew'], self.delivery.id)
+
+    def test_events_are_scoped_by_role(self):
+        event = events.order_event('status_changed', self.order)
+        self.assertTrue(events.accepts_for(self.manager, 'manager')(event))
+        self.assertTrue(events.accepts_for(self.customer, 'customer')(event))
+        self.assertFalse(events.accepts_for(self.delivery, 'delivery_crew')(event))
+        self.assertFalse(events.accepts_for(self.manager, 'customer')(event))
+
+    async def test_stream_pushes_events_to_subscriber(self):
+        token = await sync_to_async(Token.objects.create)(user=self.customer)
+        client = AsyncClient()
+        response = await client.get('/api/orders/events', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content.__aiter__()
+        self.assertEqual(await stream.__anext__(), b'retry: 3000\n\n')
+
+        next_chunk = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        events.broker.dispatch({'type': 'created', 'order': 99, 'user': self.manager.id, 'delivery_crew': None})
+        events.broker.dispatch({'type': 'created', 'order': 100, 'user': self.customer.id, 'delivery_crew': None})
+        chunk = await asyncio.wait_for(next_chunk, timeout=1)
+        self.assertIn(b'event: created', chunk)
+        self.assertIn(b'"order": 100', chunk)
+        await response.streaming_content.aclose()
+
+    @override_settings(ORDER_EVENTS_KEEPALIVE=0.01, ORDER_EVENTS_MAX_AGE=0.05)
+    async def test_stream_ends_after_max_age_and_unsubscribes(self):
+        token = await sync_to_async(Token.objects.create)(user=self.customer)
+        response = await AsyncClient().get('/api/orders/events', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(len(events.broker._subscribers), 1)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(chunks[0], b'retry: 3000\n\n')
+        self.assertIn(b': keep-alive\n\n', chunks)
+        self.assertEqual(len(events.broker._subscribers), 0)
+
+    async def test_stream_requires_authentication(self):
+        response = await AsyncClient().get('/api/orders/events')
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_is_refused_under_wsgi(self):
+        self.client.force_authenticate(user=self.customer)
+        with mock.patch.object(events.broker, 'subscribe') as subscribe:
+            response = self.client.get('/api/orders/events')
+        self.assertEqual(response.status_code, 501)
+        subscribe.assert_not_called()
+
+    def test_file_backend_skips_malformed_lines(self):
+        received = threading.Event()
+        broker = mock.Mock()
+        broker.dispatch.side_effect = lambda event: received.set()
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ORDER_EVENTS_FILE=f'{directory}/events.jsonl', ORDER_EVENTS_POLL_INTERVAL=0.01):
+            backend = events.FileBackend(broker)
+            backend.start()
+            # Retry until the tail thread has opened the file and is following it
+            for _ in range(20):
+                with open(backend.path, 'a') as fileobj:
+                    fileobj.write('{"type": "crea\n[1, 2]\n')
+                backend.publish({'type': 'created', 'order': 1})
+                if received.wait(timeout=0.1):
+                    break
+        self.assertTrue(received.is_set())
+        broker.dispatch.assert_called_with({'type': 'created', 'order': 1})
+        self.assertTrue(all(call.args == ({'type': 'created', 'order': 1},) for call in broker.dispatch.call_args_list))
+        self.assertTrue(backend._thread.is_alive())
+
+    def test_file_backend_rotates_and_keeps_following(self):
+        received = []
+        broker = mock.Mock()
+        broker.dispatch.side_effect = received.append
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ORDER_EVENTS_FILE=f'{directory}/events.jsonl', ORDER_EVENTS_POLL_INTERVAL=0.01):
+            backend = events.FileBackend(broker)
+            backend.start()
+            for _ in range(20):
+                backend.publish({'type': 'ping'})
+                time.sleep(0.05)
+                if received:
+                    break
+            # The next publish rotates the file once
+            backend.max_bytes = os.path.getsize(backend.path)
+            backend.publish({'type': 'created', 'order': 0})
+            backend.max_bytes = 10 * 1024 * 1024
+            for order in range(1, 3):
+                backend.publish({'type': 'created', 'order': order})
+            for _ in range(100):
+                if len([event for event in received if event['type'] == 'created']) == 3:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(f'{backend.path}.1'))
+            self.assertLess(os.path.getsize(backend.path), 100)
+        self.assertEqual([event['order'] for event in received if event['type'] == 'created'], [0, 1, 2])
+
+
+class CartStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer, cls.other = create_users('customer', 'other')
+        cls.chips, = create_menu(items_per_category=1, price='3.00')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def use_store(self, store):
+        patcher = mock.patch.object(carts, '_store', store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return store
+
+    def test_database_store_adds_lists_and_clears(self):
+        self.use_store(carts.DatabaseCartStore())
+        response = self.client.post('/api/cart/menu-items/', {'menuitem_id': self.chips.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['price'], '6.00')
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 1)
+        self.assertEqual(self.client.get('/api/cart/menu-items/').data['count'], 1)
+        self.client.delete('/api/cart/menu-items/')
+        self.assertFalse(Cart.objects.exists())
+
+    def test_cached_store_writes_behind(self):
+        store = self.use_store(carts.CachedCartStore(max_carts=10, flush_interval=3600))
+        self.client.post('/api/cart/menu-items/', {'menuitem_id': self.chips.id, 'quantity': 2}, format='json')
+        self.assertFalse(Cart.objects.exists())
+        response = self.client.get('/api/cart/menu-items/')
+        self.assertEqual(response.data['results'][0]['price'], '6.00')
+        store.flush()
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 2)
+
+    def test_cached_store_persists_on_eviction(self):
+        store = self.use_store(carts.CachedCartStore(max_carts=1, flush_interval=3600))
+        store.add(self.customer, self.chips, 1)
+        store.items(self.other)
+        self.assertTrue(Cart.objects.filter(user=self.customer).exists())
+        self.assertEqual(len(store.items(self.customer)), 1)
+
+    def test_flush_during_checkout_does_not_bring_cart_back(self):
+        store = self.use_store(carts.CachedCartStore(max_carts=10, flush_interval=3600))
+        store.add(self.customer, self.chips, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                store.clear(self.customer)
+                store.flush()
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(store.items(self.customer), [])
+
+    def test_rolled_back_clear_restores_cached_cart(self):
+        store = self.use_store(carts.CachedCartStore(max_carts=10, flush_interval=3600))
+        store.add(self.customer, self.chips, 2)
+        try:
+            with transaction.atomic():
+                store.clear(self.customer)
+                raise RuntimeError
+        except RuntimeError:
+            store.restore(self.customer)
+        self.assertEqual([item.quantity for item in store.items(self.customer)], [2])
+        store.flush()
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 2)
+
+    def test_flush_drops_items_deleted_from_the_menu(self):
+        store = self.use_store(carts.CachedCartStore(max_carts=10, flush_interval=3600))
+        soup, = create_menu(items_per_category=1, prefix='soup')
+        store.add(self.customer, self.chips, 1)
+        store.add(self.customer, soup, 1)
+        soup.delete()
+        store.flush()
+        self.assertEqual(list(Cart.objects.values_list('menuitem_id', flat=True)), [self.chips.id])
+        self.assertEqual([item.menuitem_id for item in store.items(self.customer)], [self.chips.id])
+
+    def test_failed_flush_does_not_fail_other_users_requests(self):
+        store = self.use_store(carts.CachedCartStore(max_carts=10, flush_interval=60))
+        store.add(self.customer, self.chips, 1)
+        store._last_flush -= 60
+        with mock.patch.object(store, '_persist', side_effect=OperationalError('database is locked')) as persist:
+            self.assertEqual(store.items(self.other), [])
+            self.assertEqual(store.items(self.other), [])
+        self.assertEqual(persist.call_count, 1)
+        self.assertIn(self.customer.pk, store._dirty)
+
+    def test_checkout_reads_cached_cart(self):
+        self.use_store(carts.CachedCartStore(max_carts=10, flush_interval=3600))
+        self.client.post('/api/cart/menu-items/', {'menuitem_id': self.chips.id, 'quantity': 2}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(OrderItem.objects.get(order_id=response.data['id']).quantity, 2)
+        self.assertEqual(self.client.get('/api/cart/menu-items/').data['count'], 0)
+
+    def test_checkout_reads_persisted_cart_on_cold_cache(self):
+        Cart.objects.create(user=self.customer, menuitem=self.chips, quantity=1, unit_price='3.00', price='3.00')
+        self.use_store(carts.CachedCartStore(max_carts=10, flush_interval=3600))
+        response = self.client.post('/api/orders/', {}, format='json')
+        self.assertEqual(Order.objects.get(pk=response.data['id']).total, Decimal('3.00'))
+
+
+class AdminPerformanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, = create_users('admin', is_staff=True, is_superuser=True)
+        cls.customer, cls.delivery = create_users('customer', 'delivery')
+        cls.chips, = create_menu(items_per_category=1, price='3.00')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_orders(self, count):
+        create_orders(self.customer, [self.chips], count=count, delivery_crew=self.delivery)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        for url in ['/admin/LittleLemonAPI/order/', '/admin/LittleLemonAPI/orderitem/']:
+            self.create_orders(2)
+            self.changelist_queries(url)  # warm the content type cache
+            few = self.changelist_queries(url)
+            self.create_orders(10)
+            self.assertEqual(self.changelist_queries(url), few)
+
+    def test_order_change_page_inline_does_not_query_per_item(self):
+        small, = create_orders(self.customer, create_menu(items_per_category=2, prefix='small'))
+        large, = create_orders(self.customer, create_menu(items_per_category=8, prefix='large'))
+        self.changelist_queries(f'/admin/LittleLemonAPI/order/{small.id}/change/')
+        few = self.changelist_queries(f'/admin/LittleLemonAPI/order/{small.id}/change/')
+        self.assertEqual(self.changelist_queries(f'/admin/LittleLemonAPI/order/{large.id}/change/'), few)
+
+    def test_paginator_uses_estimate_for_unfiltered_large_tables(self):
+        self.create_orders(3)
+        paginator = EstimatedCountPaginator(Order.objects.order_by('id'), 100)
+        paginator.exact_count_threshold = 0
+        with mock.patch('LittleLemonAPI.admin.estimate_row_count', return_value=5000000):
+            self.assertEqual(paginator.count, 5000000)
+            filtered = EstimatedCountPaginator(Order.objects.filter(status=False).order_by('id'), 100)
+            filtered.exact_count_threshold = 0
+            self.assertEqual(filtered.count, 3)
+
+    def test_sqlite_has_no_estimate_so_counts_are_exact(self):
+        self.create_orders(3)
+        Order.objects.filter(pk=Order.objects.latest('id').pk).delete()
+        paginator = EstimatedCountPaginator(Order.objects.order_by('id'), 100)
+        paginator.exact_count_threshold = 0
+        self.assertEqual(paginator.count, 2)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, = create_users('admin', is_staff=True, is_superuser=True)
+        cls.customer, = create_users('customer')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILING_DIR=directory.name, PROFILING_MAX_FILES=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+
+    def test_staff_header_profiles_request(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/categories/', HTTP_X_PROFILE='deterministic')
+        profile_id = response['X-Profile-Id']
+
+        download = self.client.get(f'/api/profiles/{profile_id}')
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        collapsed = b''.join(download.streaming_content).decode()
+        stack, value = collapsed.splitlines()[0].rsplit(' ', 1)
+        self.assertIn(';', stack)
+        self.assertGreater(int(value), 0)
+
+        queries = self.client.get(f'/api/profiles/{profile_id}/queries')
+        self.assertGreater(queries.data['query_count'], 0)
+        self.assertIn('SELECT', queries.data['queries'][0]['sql'])
+
+    def test_non_staff_header_is_ignored(self):
+        self.client.force_login(self.customer)
+        response = self.client.get('/api/categories/', HTTP_X_PROFILE='sampling')
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_invalid_token_with_profile_header_is_unauthorized(self):
+        response = self.client.get('/api/categories/', HTTP_X_PROFILE='sampling', HTTP_AUTHORIZATION='Token bogus')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_token_authenticated_staff_is_recorded(self):
+        token = Token.objects.create(user=self.admin)
+        response = self.client.get('/api/categories/', HTTP_X_PROFILE='sampling', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertIn('X-Profile-Id', response)
+        self.assertEqual([profile['user'] for profile in profiling.list_profiles()], ['admin'])
+
+    def test_profiles_are_kept_in_a_bounded_ring(self):
+        self.client.force_login(self.admin)
+        ids = [self.client.get('/api/categories/?profile=sampling')['X-Profile-Id'] for _ in range(3)]
+        listed = [profile['id'] for profile in self.client.get('/api/profiles/').data]
+        self.assertEqual(sorted(listed), sorted(ids[1:]))
+
+    def test_profile_download_requires_admin(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get('/api/profiles/').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PopularityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer, = create_users('customer')
+        cls.drinks = Category.objects.create(slug='drinks', title='Drinks')
+        cls.mains = Category.objects.create(slug='mains', title='Mains')
+        cls.tea = MenuItem.objects.create(title='Tea', price='2.00', category=cls.drinks)
+        cls.soda = MenuItem.objects.create(title='Soda', price='3.00', category=cls.drinks)
+        cls.steak = MenuItem.objects.create(title='Steak', price='20.00', category=cls.mains)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def checkout(self, *items):
+        fill_cart(self.customer, items)
+        self.client.post('/api/orders/', {}, format='json')
+        jobs.run_pending()
+
+    def test_top_items_follow_checkouts(self):
+        self.checkout(self.tea, self.steak)
+        self.checkout(self.tea)
+        self.checkout(self.soda)
+        response = self.client.get('/api/menu-items/top?window=7d')
+        self.assertEqual([item['title'] for item in response.data['results']], ['Tea', 'Steak', 'Soda'])
+        self.assertEqual(response.data['results'][0]['order_count'], 2)
+        self.assertEqual(response.data['results'][0]['revenue'], '4.00')
+
+        response = self.client.get(f'/api/menu-items/top?window=today&category={self.mains.id}')
+        self.assertEqual([item['title'] for item in response.data['results']], ['Steak'])
+        response = self.client.get('/api/menu-items/top?window=30d&category=drinks')
+        self.assertEqual([item['title'] for item in response.data['results']], ['Tea', 'Soda'])
+
+    def test_top_items_read_one_precomputed_row(self):
+        self.checkout(self.tea)
+        with self.assertNumQueries(1):
+            self.client.get('/api/menu-items/top?window=30d')
+
+    def test_rebuild_fixes_drift(self):
+        self.checkout(self.tea)
+        MenuItemDailyStats.objects.update(order_count=50)
+        popularity.rebuild()
+        response = self.client.get('/api/menu-items/top?window=7d')
+        self.assertEqual(response.data['results'][0]['order_count'], 1)
+
+    def test_redelivered_job_does_not_count_order_twice(self):
+        self.checkout(self.tea)
+        order = Order.objects.get()
+        jobs.record_order_popularity(order_id=order.pk)
+        self.assertEqual(MenuItemDailyStats.objects.get(menuitem=self.tea).order_count, 1)
+
+    def test_rebuild_covers_orders_whose_job_has_not_run(self):
+        fill_cart(self.customer, [self.tea])
+        self.client.post('/api/orders/', {}, format='json')
+        popularity.rebuild()
+        jobs.run_pending()
+        self.assertEqual(MenuItemDailyStats.objects.get(menuitem=self.tea).order_count, 1)
+
+    def test_rebuild_job_reschedules_itself_once(self):
+        jobs.schedule_recurring()
+        jobs.schedule_recurring()
+        self.assertEqual(jobs.run_pending(), 1)
+        upcoming = Job.objects.get(name='rebuild_popularity', status=Job.QUEUED)
+        self.assertGreater(upcoming.run_at, timezone.now())
+        jobs.schedule_recurring()
+        self.assertEqual(Job.objects.filter(name='rebuild_popularity', status=Job.QUEUED).count(), 1)
+
+    def test_one_global_ranking_per_window(self):
+        PopularityRanking.objects.create(window='7d')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PopularityRanking.objects.create(window='7d')
+
+    def test_unknown_window_is_rejected(self):
+        response = self.client.get('/api/menu-items/top?window=1y')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DeliveryWorkloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, delivery_group = create_groups()
+        cls.delivery, cls.other_crew = create_users('delivery', 'other-crew', group=delivery_group)
+        cls.alice, cls.bob, cls.carol = create_users('alice', 'bob', 'carol')
+        menu = create_menu(items_per_category=2, price='4.00')
+        cls.alice_orders = create_orders(cls.alice, menu, count=2, quantity=2, delivery_crew=cls.delivery)
+        cls.bob_orders = create_orders(cls.bob, menu[:1], count=2, delivery_crew=cls.delivery)
+        cls.carol_orders = create_orders(cls.carol, menu[:1], delivery_crew=cls.delivery)
+        create_orders(cls.carol, menu[:1], delivery_crew=cls.delivery, status=True)
+        create_orders(cls.carol, menu[:1], delivery_crew=cls.other_crew)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.delivery)
+
+    @override_settings(DELIVERY_BATCH_SIZE=4)
+    def test_workload_groups_undelivered_orders_into_batches(self):
+        with self.assertNumQueries(2):  # group check + workload
+            response = self.client.get('/api/orders/workload')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['orders'], 5)
+        self.assertEqual(response.data['items'], 11)
+        self.assertEqual(response.data['total'], '44.00')
+        self.assertEqual(response.data['batches'][0]['total'], '40.00')
+        self.assertEqual(response.data['batches'][0]['orders'][0]['total'], '16.00')
+        self.assertIn(b'"total":"44.00"', response.content)
+        batches = [[order['customer'] for order in batch['orders']] for batch in response.data['batches']]
+        self.assertEqual(batches, [['alice', 'alice', 'bob', 'bob'], ['carol']])
+        self.assertEqual(response.data['batches'][0]['items'], 10)
+
+    def test_batch_delivery_marks_only_own_orders(self):
+        others = Order.objects.filter(delivery_crew=self.other_crew).values_list('id', flat=True)
+        ids = [order.id for order in self.alice_orders] + list(others)
+        with self.assertNumQueries(5):  # group check + savepoint + select + update + release
+            response = self.client.post('/api/orders/workload', {'delivered': ids}, format='json')
+        self.assertEqual(sorted(response.data['delivered']), sorted(order.id for order in self.alice_orders))
+        self.assertFalse(Order.objects.filter(pk__in=others, status=True).exists())
+        self.assertEqual(self.client.get('/api/orders/workload').data['orders'], 3)
+
+    @override_settings(DELIVERY_BATCH_SIZE=1)
+    def test_customers_with_more_orders_than_a_batch_are_split(self):
+        response = self.client.get('/api/orders/workload')
+        batches = [[order['customer'] for order in batch['orders']] for batch in response.data['batches']]
+        self.assertEqual(batches, [['alice'], ['alice'], ['bob'], ['bob'], ['carol']])
+
+    def test_batch_delivery_skips_orders_reassigned_before_update(self):
+        moved, kept = self.alice_orders
+        reassigned = []
+
+        def reassign_after_select(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith('SELECT "LittleLemonAPI_order"') and not reassigned:
+                # A manager hands one order to another crew in between
+                reassigned.append(moved.pk)
+                Order.objects.filter(pk=moved.pk).update(delivery_crew=self.other_crew)
+            return result
+
+        backend = RecordingBackend()
+        with mock.patch.object(events, '_backend', backend), self.captureOnCommitCallbacks(execute=True), \
+                connection.execute_wrapper(reassign_after_select):
+            response = self.client.post('/api/orders/workload', {'delivered': [moved.id, kept.id]}, format='json')
+        self.assertEqual(response.data['delivered'], [kept.id])
+        self.assertFalse(Order.objects.get(pk=moved.pk).status)
+        self.assertEqual([event['order'] for event in backend.published], [kept.id])
+
+    def test_workload_is_for_delivery_crew_only(self):
+        self.client.force_authenticate(user=self.alice)
+        self.assertEqual(self.client.get('/api/orders/workload').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer, = create_users('customer')
+        cls.menu = create_menu(items_per_category=3, price='4.00')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def checkout(self):
+        fill_cart(self.customer, self.menu, quantity=2)
+        return self.client.post('/api/orders/', {}, format='json').data['id']
+
+    def test_history_shows_items_as_ordered(self):
+        order_id = self.checkout()
+        category = Category.objects.create(slug='renamed', title='Renamed')
+        MenuItem.objects.filter(pk=self.menu[0].pk).update(title='New title', price='9.00', category=category)
+
+        response = self.client.get(f'/api/orders/{order_id}')
+        item = response.data['order_items'][0]
+        self.assertEqual(item['menuitem']['title'], self.menu[0].title)
+        self.assertEqual(item['menuitem']['price'], '4.00')
+        self.assertEqual(item['menuitem']['category']['slug'], self.menu[0].category.slug)
+        self.assertEqual(item['quantity'], 2)
+        self.assertEqual(item['price'], '8.00')
+
+    def test_history_reads_do_not_touch_order_items(self):
+        for _ in range(3):
+            self.checkout()
+        # group checks + count + one page of orders
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/orders/')
+        self.assertEqual(len(response.data['results'][0]['order_items']), 3)
+
+    def test_orders_without_snapshot_fall_back_to_live_items(self):
+        order, = create_orders(self.customer, self.menu[:1])
+        response = self.client.get(f'/api/orders/{order.id}')
+        self.assertEqual(response.data['order_items'][0]['menuitem']['id'], self.menu[0].id)
+
+    def test_fallback_items_are_prefetched_for_the_whole_page(self):
+        create_orders(self.customer, self.menu, count=3)
+        # group checks + count + one page of orders + items, menu items, categories
+        with self.assertNumQueries(7):
+            response = self.client.get('/api/orders/')
+        self.assertEqual([len(order['order_items']) for order in response.data['results']], [3, 3, 3])
+        self.assertEqual(response.data['results'][0]['order_items'][0]['menuitem']['category']['id'], self.menu[0].category_id)
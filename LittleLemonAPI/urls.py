@@ -7,14 +7,22 @@ urlpatterns = [
     path('categories/', views.CategoryView.as_view(), name='categories'),
     path('menu-items/', views.MenuItemView.as_view(), name='menu-items'),
     path('menu-items/<int:pk>', views.SingleMenuItemView.as_view(), name='single-menu-item'),
+    path('menu-items/import', views.MenuItemImportView.as_view(), name='menu-items-import'),
+    path('menu-items/reprice', views.MenuItemRepriceView.as_view(), name='menu-items-reprice'),
+    path('menu-items/top', views.TopMenuItemsView.as_view(), name='menu-items-top'),
     path('cart/menu-items/', views.CartView.as_view(), name='cart'),
     path('orders/', views.OrderView.as_view(), name='orders'),
     path('orders/<int:pk>', views.SingleOrderView.as_view(), name='single-order'),
+    path('orders/events', views.order_events, name='order-events'),
+    path('orders/workload', views.DeliveryWorkloadView.as_view(), name='delivery-workload'),
     path('groups/manager/users/', views.ManagerGroupView.as_view(), name='manager-group'),
     path('groups/delivery-crew/users/', views.DeliveryCrewGroupView.as_view(), name='delivery-group'),
     path('api/managers/', views.managers),
     path('api/delivery-crew/', views.delivery_crew),
     path('api/users/register/', views.UserCreateView.as_view()),
+    path('profiles/', views.ProfileListView.as_view(), name='profiles'),
+    path('profiles/<str:profile_id>', views.ProfileDetailView.as_view(), name='profile-download'),
+    path('profiles/<str:profile_id>/queries', views.ProfileQueriesView.as_view(), name='profile-queries'),
     
  ]
     
@@ -7,9 +7,26 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.contrib.auth.models import User, Group
 from django.shortcuts import get_object_or_404
-from .models import Category, MenuItem, Cart, Order, OrderItem
-from .serializers import CategorySerializer, MenuItemSerializer, CartSerializer, OrderSerializer
+from .models import Category, MenuItem, Cart, Order, OrderItem, PopularityRanking
+from .serializers import CategorySerializer, MenuItemSerializer, CartSerializer, OrderSerializer, OrderItemSerializer
 from .permissions import IsManager, IsDeliveryCrew, IsCustomer
+from .routers import read_from_replica
+from .jobs import enqueue
+from .carts import get_cart_store
+from .profiling import list_profiles, profile_path
+from .popularity import WINDOWS
+from .delivery import crew_workload, mark_delivered
+from .bulk import parse_menu_file, import_menu_items, reprice_menu_items, set_menu_item_prices
+from django.conf import settings
+from django.db import transaction
+from . import events
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.request import Request
 from django.http import JsonResponse
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
@@ -19,8 +36,14 @@ from rest_framework import serializers
 def index(request):
     return JsonResponse({"message": "Hello from LittleLemonAPI!"})
 
+# List actions are safe to serve from a read replica, falling back to the
+# primary if the replica fails mid-request
+class ReplicaListMixin:
+    def list(self, request, *args, **kwargs):
+        return read_from_replica(super().list, request, *args, **kwargs)
+
 # Category Views
-class CategoryView(generics.ListCreateAPIView):
+class CategoryView(ReplicaListMixin, generics.ListCreateAPIView):
         queryset = Category.objects.all().order_by('id')
         serializer_class = CategorySerializer
     
@@ -30,7 +53,7 @@ class CategoryView(generics.ListCreateAPIView):
             return [IsAuthenticated(), IsAdminUser()]
 
 # Menu Item Views
-class MenuItemView(generics.ListCreateAPIView):
+class MenuItemView(ReplicaListMixin, generics.ListCreateAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     ordering_fields = ['price']
@@ -54,28 +77,93 @@ class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
         return [IsAuthenticated(), IsAdminUser()]
 
 
+# Popular dishes, served from rankings precomputed at checkout
+class TopMenuItemsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        window = request.query_params.get('window', '7d')
+        if window not in WINDOWS:
+            return Response({'error': f"window must be one of {', '.join(WINDOWS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        category = request.query_params.get('category') or None
+        rankings = PopularityRanking.objects.filter(window=window)
+        if category is None:
+            rankings = rankings.filter(category__isnull=True)
+        elif category.isdigit():
+            rankings = rankings.filter(category_id=category)
+        else:
+            rankings = rankings.filter(category__slug=category)
+        items = rankings.values_list('items', flat=True).first()
+        return Response({'window': window, 'category': category, 'results': items or []})
+
+
+# Bulk menu management for managers and admins
+class MenuItemImportView(APIView):
+    permission_classes = [IsAuthenticated, IsManager | IsAdminUser]
+
+    def post(self, request):
+        try:
+            if 'file' in request.FILES:
+                upload = request.FILES['file']
+                rows = parse_menu_file(upload, upload.name)
+            elif isinstance(request.data, list):
+                rows = request.data
+            elif 'items' in request.data:
+                rows = request.data['items']
+            else:
+                return Response({'error': 'Upload a CSV/JSON file or send a list of items'}, status=status.HTTP_400_BAD_REQUEST)
+            result = import_menu_items(rows)
+        except (ValueError, TypeError, AttributeError) as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+class MenuItemRepriceView(APIView):
+    permission_classes = [IsAuthenticated, IsManager | IsAdminUser]
+
+    def post(self, request):
+        data = request.data
+        try:
+            if 'prices' in data:
+                updated = set_menu_item_prices({int(pk): price for pk, price in data['prices'].items()})
+                return Response({'updated': updated})
+
+            queryset = MenuItem.objects.all()
+            if 'ids' in data:
+                queryset = queryset.filter(pk__in=[int(pk) for pk in data['ids']])
+            if 'category' in data:
+                category = str(data['category'])
+                if category.isdigit():
+                    queryset = queryset.filter(category_id=category)
+                else:
+                    queryset = queryset.filter(category__slug=category)
+            if not ('ids' in data or 'category' in data or data.get('all')):
+                return Response({'error': 'Provide ids, category or all'}, status=status.HTTP_400_BAD_REQUEST)
+            updated = reprice_menu_items(queryset, price=data.get('price'), percent=data.get('percent'))
+        except (ValueError, TypeError, AttributeError) as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated': updated})
+
+
 # Cart Views
 class CartView(generics.ListCreateAPIView, generics.DestroyAPIView):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated, IsCustomer]
     
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return get_cart_store().items(self.request.user)
     
     def perform_create(self, serializer):
-        menuitem = serializer.validated_data['menuitem']
+        menuitem = get_object_or_404(MenuItem.objects.select_related('category'), pk=serializer.validated_data['menuitem_id'])
         quantity = serializer.validated_data['quantity']
-        unit_price = menuitem.price
-        price = quantity * unit_price
-        serializer.save(user=self.request.user, unit_price=unit_price, price=price)
+        serializer.instance = get_cart_store().add(self.request.user, menuitem, quantity)
         
     
     def delete(self, request, *args, **kwargs):
-        Cart.objects.filter(user=request.user).delete()
+        get_cart_store().clear(request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 # Order Views
-class OrderView(generics.ListCreateAPIView):
+class OrderView(ReplicaListMixin, generics.ListCreateAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     
@@ -89,23 +177,39 @@ class OrderView(generics.ListCreateAPIView):
             return Order.objects.filter(user=user)
     
     def perform_create(self, serializer):
-        cart_items = Cart.objects.filter(user=self.request.user)
-        if not cart_items.exists():
-            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        cart_store = get_cart_store()
+        cart_items = cart_store.items(self.request.user)
+        if not cart_items:
+            raise serializers.ValidationError({'error': 'Cart is empty'})
         
         total = sum(item.price for item in cart_items)
-        order = serializer.save(user=self.request.user, total=total)
-        
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
+        order_items = [
+            OrderItem(
                 menuitem=cart_item.menuitem,
                 quantity=cart_item.quantity,
                 unit_price=cart_item.unit_price,
                 price=cart_item.price
             )
-        
-        cart_items.delete()
+            for cart_item in cart_items
+        ]
+        items_snapshot = OrderItemSerializer(order_items, many=True).data
+        cleared = False
+        try:
+            with transaction.atomic():
+                order = serializer.save(user=self.request.user, total=total, items_snapshot=items_snapshot)
+                for order_item in order_items:
+                    order_item.order = order
+                OrderItem.objects.bulk_create(order_items)
+                # Emptying the cart stays inline so it can't be checked out twice
+                cart_store.clear(self.request.user)
+                cleared = True
+                enqueue('notify_order_placed', order_id=order.pk)
+                enqueue('record_order_popularity', order_id=order.pk)
+                events.publish(events.order_event('created', order))
+        except Exception:
+            if cleared:
+                cart_store.restore(self.request.user)
+            raise
 
 class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = OrderSerializer
@@ -120,6 +224,12 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
         else:
             return Order.objects.filter(user=user)
 
+    def perform_update(self, serializer):
+        previous_crew = serializer.instance.delivery_crew_id
+        previous_status = serializer.instance.status
+        order = serializer.save()
+        events.publish_order_changes(order, previous_crew, previous_status)
+
     def update(self, request, *args, **kwargs):
         order = self.get_object()
         user = request.user
@@ -131,14 +241,87 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
         elif user.groups.filter(name='Delivery Crew').exists():
             # Delivery crew can only update status
             if 'status' in request.data:
+                previous_status = order.status
                 order.status = request.data['status']
                 order.save()
+                events.publish_order_changes(order, order.delivery_crew_id, previous_status)
                 return Response(OrderSerializer(order).data)
             return Response({'error': 'You can only update status'}, status=403)
         
         return Response({'error': 'Not allowed'}, status=403)
 
 
+# Delivery crew: all undelivered orders in batches, and bulk delivery
+class DeliveryWorkloadView(APIView):
+    permission_classes = [IsAuthenticated, IsDeliveryCrew]
+
+    def get(self, request):
+        return Response(crew_workload(request.user))
+
+    def post(self, request):
+        delivered = request.data.get('delivered')
+        if not isinstance(delivered, list) or not delivered:
+            return Response({'error': 'delivered must be a list of order ids'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order_ids = [int(order_id) for order_id in delivered]
+        except (TypeError, ValueError):
+            return Response({'error': 'delivered must be a list of order ids'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'delivered': mark_delivered(request.user, order_ids)})
+
+
+# Order event stream (server-sent events, needs ASGI)
+def _event_stream_user(request):
+    user = Request(request, authenticators=[TokenAuthentication(), SessionAuthentication()]).user
+    if not user.is_authenticated:
+        return None, None
+    if user.groups.filter(name='Manager').exists():
+        return user, 'manager'
+    elif user.groups.filter(name='Delivery Crew').exists():
+        return user, 'delivery_crew'
+    return user, 'customer'
+
+async def order_events(request):
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI Django would buffer this endless stream and never respond.
+        return JsonResponse(
+            {'detail': 'Order events need the ASGI application (LittleLemon.asgi:application).'},
+            status=501,
+        )
+    user, role = await sync_to_async(_event_stream_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    subscription = events.broker.subscribe(events.accepts_for(user, role))
+
+    # Django 4.2 doesn't notice a client disconnecting mid-stream, so each
+    # stream ends after ORDER_EVENTS_MAX_AGE and EventSource reconnects;
+    # otherwise an abandoned stream would hold its subscription forever.
+    keepalive = getattr(settings, 'ORDER_EVENTS_KEEPALIVE', 15)
+    deadline = asyncio.get_running_loop().time() + getattr(settings, 'ORDER_EVENTS_MAX_AGE', 300)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            loop = asyncio.get_running_loop()
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=min(keepalive, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def group_usernames(name):
+    return [user.username for user in Group.objects.get(name=name).user_set.all()]
+
 # Manager Group Management
 @api_view(['POST', 'GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
@@ -155,9 +338,8 @@ def managers(request):
         return Response({'message': f'User {username} added to Manager group'}, status=status.HTTP_201_CREATED)
     
     elif request.method == 'GET':
-        managers_group = Group.objects.get(name='Manager')
-        managers = managers_group.user_set.all()
-        return Response({'managers': [user.username for user in managers]})
+        managers = read_from_replica(group_usernames, 'Manager')
+        return Response({'managers': managers})
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsManager])
@@ -184,9 +366,8 @@ def delivery_crew(request):
         return Response({'message': f'User {username} added to Delivery Crew group'}, status=status.HTTP_201_CREATED)
     
     elif request.method == 'GET':
-        delivery_group = Group.objects.get(name='Delivery Crew')
-        delivery_crew = delivery_group.user_set.all()
-        return Response({'delivery_crew': [user.username for user in delivery_crew]})
+        delivery_crew = read_from_replica(group_usernames, 'Delivery Crew')
+        return Response({'delivery_crew': delivery_crew})
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsManager])
@@ -203,8 +384,7 @@ class ManagerGroupView(APIView):
     permission_classes = [IsAdminUser]   # Only Admin can do this
 
     def get(self, request):
-        managers = Group.objects.get(name="Manager").user_set.all()
-        return Response([user.username for user in managers])
+        return Response(read_from_replica(group_usernames, "Manager"))
 
     def post(self, request):
         username = request.data.get("username")
@@ -235,8 +415,7 @@ class DeliveryCrewGroupView(APIView):
         if not request.user.groups.filter(name="Manager").exists():
             return Response({"error": "Only Managers can view delivery crew"}, status=403)
 
-        delivery_crew = Group.objects.get(name="Delivery Crew").user_set.all()
-        return Response([user.username for user in delivery_crew])
+        return Response(read_from_replica(group_usernames, "Delivery Crew"))
 
     def post(self, request):
         if not request.user.groups.filter(name="Manager").exists():
@@ -279,3 +458,30 @@ class UserCreateView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
+
+
+# Request profiles recorded by ProfilingMiddleware
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list_profiles())
+
+class ProfileDetailView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        path = profile_path(profile_id, '.collapsed')
+        if path is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name, content_type='text/plain')
+
+class ProfileQueriesView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        path = profile_path(profile_id, '.json')
+        if path is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        with open(path) as fileobj:
+            return Response(json.load(fileobj))